@@ -4,11 +4,17 @@ Client script that records from local microphone and sends the audio data
 to a server running on a Digital Ocean droplet
 """
 import pyaudio
+import atexit
+import numpy as np
+import soundfile
 import socket
 import time
+import sys
 import argparse
 import wave
-import os
+import io
+import struct
+import threading
 
 # Audio recording parameters
 RATE = 16000        # Sample rate
@@ -16,89 +22,274 @@ CHUNK = 1024        # Buffer size
 FORMAT = pyaudio.paInt16  # 16-bit audio
 CHANNELS = 1        # Mono audio
 RECORD_SECONDS = 5  # Default recording duration
+RING_SLOTS = 32     # Ring buffer slots of CHUNK frames each (must be a power of two)
+SEND_BATCH = 8      # Audio chunks coalesced into a single socket write
+SEND_BUFFER = 1 << 20  # Socket send buffer size in bytes
+LENGTH_PREFIX = struct.Struct(">I")  # 4-byte big-endian message length
+FLAC_MESSAGE = 1 << 14  # Bytes of FLAC data per message
+CODECS = ["linear16", "flac"]  # Audio encodings the server understands
 
-def record_and_send(server_ip, server_port, duration=RECORD_SECONDS, save_local=False):
-    """Record audio from microphone and send to the remote server"""
-    # Initialize PyAudio
-    p = pyaudio.PyAudio()
+# PyAudio instance shared by all recordings (PortAudio is set up only once)
+_pa = None
+
+def get_pyaudio():
+    """Return the shared PyAudio instance, creating it on first use"""
+    global _pa
+    if _pa is None:
+        _pa = pyaudio.PyAudio()
+        atexit.register(_pa.terminate)
+    return _pa
+
+def send_buffers(sock, buffers):
+    """Send a list of bytes-like buffers using as few system calls as possible"""
+    if not hasattr(sock, "sendmsg"):
+        # No scatter-gather I/O on this platform (e.g. Windows)
+        sock.sendall(b"".join(buffers))
+        return
     
-    # Open audio stream
-    stream = p.open(format=FORMAT,
-                    channels=CHANNELS,
-                    rate=RATE,
-                    input=True,
-                    frames_per_buffer=CHUNK)
+    buffers = [memoryview(b) for b in buffers]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        # Drop whatever the kernel accepted and retry with the remainder
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if sent:
+            buffers[0] = buffers[0][sent:]
+
+def send_msg(sock, payload):
+    """Send a single length-prefixed message"""
+    send_buffers(sock, [LENGTH_PREFIX.pack(len(payload)), payload])
+
+def recv_exact(sock, n):
+    """Receive exactly n bytes into a preallocated buffer"""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    off = 0
+    while off < n:
+        received = sock.recv_into(view[off:])
+        if not received:
+            raise ConnectionError("Connection closed by server")
+        off += received
+    return buf
+
+def recv_msg(sock):
+    """Receive a single length-prefixed message"""
+    (length,) = LENGTH_PREFIX.unpack(recv_exact(sock, LENGTH_PREFIX.size))
+    return recv_exact(sock, length)
+
+def encode_flac(samples):
+    """Compress int16 samples into an in-memory FLAC file and return its bytes"""
+    buf = io.BytesIO()
+    soundfile.write(buf, samples, RATE, format='FLAC', subtype='PCM_16')
+    return buf.getbuffer()
+
+def record_and_send(server_ip, server_port, duration=RECORD_SECONDS, save_local=False,
+                    codec="linear16"):
+    """Record audio from microphone and send to the remote server
     
-    print(f"Connecting to server at {server_ip}:{server_port}...")
+    linear16 streams raw PCM while recording; flac records the whole clip
+    first and only then connects and sends it compressed, trading latency
+    for bandwidth.
+    """
+    # Get the shared PyAudio instance
+    p = get_pyaudio()
+    sample_width = p.get_sample_size(FORMAT)
+    total_bytes = int(RATE / CHUNK * duration) * CHUNK * CHANNELS * sample_width
     
-    # Create socket and connect to server
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client_socket.connect((server_ip, server_port))
-    except ConnectionRefusedError:
-        print("Error: Could not connect to server. Make sure the server is running.")
-        return
+    # Single-producer/single-consumer ring of fixed CHUNK-sized slots. The
+    # audio callback fills slot tail and then advances tail; this thread
+    # sends slots from head and advances head only once they are on the
+    # wire. Each counter has a single writer, so no lock is needed.
+    block = CHUNK * CHANNELS * sample_width
+    ring = bytearray(RING_SLOTS * block)
+    ring_view = memoryview(ring)
+    slot_sizes = [0] * RING_SLOTS
+    head = 0
+    tail = 0
+    dropped = 0
+    data_ready = threading.Event()
+    finished = threading.Event()
+    # Only a local copy or FLAC encoding needs the whole clip; keep it as
+    # int16 samples
+    live = codec == "linear16"
+    keep_samples = save_local or not live
+    samples = np.empty(total_bytes // sample_width, dtype=np.int16) if keep_samples else None
+    recorded = 0
     
-    # Send audio format information
-    format_info = f"{RATE},{CHANNELS},{p.get_sample_size(FORMAT)}"
-    client_socket.sendall(format_info.encode('utf-8'))
+    def callback(in_data, frame_count, time_info, status):
+        """Copy captured audio into the next ring slot (runs on the PortAudio thread)"""
+        nonlocal tail, recorded, dropped
+        n = min(len(in_data), total_bytes - recorded)
+        data = memoryview(in_data)[:n]
+        if samples is not None:
+            offset = recorded // sample_width
+            samples[offset:offset + n // sample_width] = np.frombuffer(data, dtype=np.int16)
+        
+        # frames_per_buffer=CHUNK makes every callback exactly one slot. If the
+        # sender is a whole ring behind, drop the block rather than overwrite
+        # audio that hasn't been sent yet. FLAC is sent from the samples
+        # afterwards, so it doesn't use the ring at all.
+        if not live:
+            pass
+        elif tail - head < RING_SLOTS:
+            slot = tail & (RING_SLOTS - 1)
+            ring_view[slot * block:slot * block + n] = data
+            slot_sizes[slot] = n
+            tail += 1  # Publish the slot only after it has been filled
+        else:
+            dropped += 1
+        recorded += n
+        data_ready.set()
+        
+        if recorded >= total_bytes:
+            finished.set()
+            return (None, pyaudio.paComplete)
+        return (None, pyaudio.paContinue)
     
-    # Wait for acknowledgment
-    ack = client_socket.recv(1024)
-    if ack != b"ACK":
-        print("Error: Server did not acknowledge format info")
-        return
+    def connect():
+        """Connect to the server and announce the audio format; returns None on failure"""
+        print(f"Connecting to server at {server_ip}:{server_port}...")
+        
+        # Create socket and connect to server
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            client_socket.connect((server_ip, server_port))
+        except ConnectionRefusedError:
+            print("Error: Could not connect to server. Make sure the server is running.")
+            client_socket.close()
+            return None
+        
+        # We coalesce audio chunks ourselves, so don't let Nagle delay them further
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        
+        # Send audio format information
+        format_info = f"{codec},{RATE},{CHANNELS},{sample_width}"
+        send_msg(client_socket, format_info.encode('utf-8'))
+        
+        # Wait for acknowledgment
+        ack = recv_msg(client_socket)
+        if ack != b"ACK":
+            print("Error: Server did not acknowledge format info")
+            client_socket.close()
+            return None
+        return client_socket
     
-    print(f"Recording for {duration} seconds...")
-    frames = []
-    
-    # Start recording with a visual indicator
-    for i in range(0, int(RATE / CHUNK * duration)):
-        data = stream.read(CHUNK)
-        frames.append(data)
-        # Send the audio chunk to the server
-        client_socket.sendall(data)
-        # Print a simple progress indicator
-        if i % 10 == 0:
-            dots = "." * (i // 10 % 4)
-            print(f"\rRecording and sending{dots:<3}", end="")
+    # Open audio stream (started once the server has acknowledged us when
+    # streaming)
+    stream = p.open(format=FORMAT,
+                    channels=CHANNELS,
+                    rate=RATE,
+                    input=True,
+                    frames_per_buffer=CHUNK,
+                    stream_callback=callback,
+                    start=False)
     
-    print("\nFinished recording!")
+    # Streaming needs the connection up before recording; FLAC connects once
+    # the clip is encoded, since the server's stream to Google would time
+    # out waiting for audio while we record
+    if live:
+        client_socket = connect()
+        if client_socket is None:
+            stream.close()
+            return
     
-    # Signal end of transmission
-    client_socket.sendall(b"END")
+    print(f"Recording for {duration} seconds...")
+    stream.start_stream()
     
-    # Receive transcription from server
-    print("Waiting for transcription results...")
-    transcription_data = b""
+    # Send audio to the server as the callback produces it, SEND_BATCH slots
+    # per length-prefixed message. The ring holds about two seconds of audio,
+    # so the sender only has to keep roughly up.
+    pending = []
+    pending_size = 0
+    read = 0
+    show_progress = sys.stdout.isatty()
+    progress_label = "Recording and sending" if live else "Recording"
+    last_print = 0.0
+    ticks = 0
     while True:
-        chunk = client_socket.recv(4096)
-        if chunk == b"" or b"END_TRANSCRIPTION" in chunk:
-            if b"END_TRANSCRIPTION" in chunk:
-                transcription_data += chunk.split(b"END_TRANSCRIPTION")[0]
-            break
-        transcription_data += chunk
+        # Print a simple progress indicator, at most once a second and only
+        # to a terminal
+        if show_progress:
+            now = time.monotonic()
+            if now - last_print >= 1.0:
+                last_print = now
+                dots = "." * (ticks % 4)
+                sys.stdout.write(f"\r{progress_label}{dots:<3}")
+                sys.stdout.flush()
+                ticks += 1
+        
+        if read == tail:
+            # The callback publishes its last slot before setting finished
+            if finished.is_set() and read == tail:
+                break
+            data_ready.wait(0.1)
+            data_ready.clear()
+            continue
+        
+        slot = read & (RING_SLOTS - 1)
+        start = slot * block
+        read += 1
+        
+        # Queue the audio chunk and send once a full batch is ready; the
+        # slots are handed back to the callback only after they are sent
+        pending.append(ring_view[start:start + slot_sizes[slot]])
+        pending_size += slot_sizes[slot]
+        if len(pending) >= SEND_BATCH:
+            send_buffers(client_socket, [LENGTH_PREFIX.pack(pending_size)] + pending)
+            pending.clear()
+            pending_size = 0
+            head = read
+    
+    print("\nFinished recording!")
+    if dropped:
+        print(f"Warning: dropped {dropped} audio blocks because sending fell behind")
     
-    # Close everything
+    # Close the audio stream
     stream.stop_stream()
     stream.close()
-    p.terminate()
-    client_socket.close()
+    
+    # Flush the final partial batch and signal end of transmission with an
+    # empty message
+    if live:
+        if pending:
+            send_buffers(client_socket, [LENGTH_PREFIX.pack(pending_size)] + pending)
+        send_msg(client_socket, b"")
     
     # Save recording locally if requested
     if save_local:
         wf = wave.open("local_recording.wav", 'wb')
         wf.setnchannels(CHANNELS)
-        wf.setsampwidth(p.get_sample_size(FORMAT))
+        wf.setsampwidth(sample_width)
         wf.setframerate(RATE)
-        wf.writeframes(b''.join(frames))
+        wf.writeframes(memoryview(samples).cast('B'))
         wf.close()
         print("Local recording saved as 'local_recording.wav'")
     
-    # Display transcription results
+    # Send the compressed clip now that it is complete
+    if not live:
+        flac_data = encode_flac(samples)
+        client_socket = connect()
+        if client_socket is None:
+            return
+        for off in range(0, len(flac_data), FLAC_MESSAGE):
+            send_msg(client_socket, flac_data[off:off + FLAC_MESSAGE])
+        send_msg(client_socket, b"")
+        print(f"Sent {len(flac_data)} bytes of FLAC ({total_bytes} bytes of PCM)")
+    
+    # Receive transcription results from the server as they are produced,
+    # one message per result until an empty message
+    print("Waiting for transcription results...")
     print("\nTranscription Results:")
     print("---------------------")
-    print(transcription_data.decode('utf-8'))
+    while True:
+        result_text = recv_msg(client_socket)
+        if not result_text:
+            break
+        print(str(result_text, 'utf-8'))
+    
+    client_socket.close()
 
 def main():
     """Parse command line arguments and start recording"""
@@ -111,11 +302,13 @@ def main():
                         help=f'Recording duration in seconds (default: {RECORD_SECONDS})')
     parser.add_argument('--save', action='store_true', 
                         help='Save recording locally')
+    parser.add_argument('--codec', '-c', choices=CODECS, default='linear16',
+                        help='Audio encoding sent to the server (default: linear16)')
     
     args = parser.parse_args()
     
     try:
-        record_and_send(args.server, args.port, args.duration, args.save)
+        record_and_send(args.server, args.port, args.duration, args.save, args.codec)
     except KeyboardInterrupt:
         print("\nRecording stopped by user")
     except Exception as e:
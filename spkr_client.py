@@ -3,23 +3,165 @@
 Client script that sends text to a server running on a Digital Ocean droplet
 and plays the synthesized speech on local speakers
 """
-import os
 import io
+import json
 import socket
+import struct
 import argparse
-import pygame
-import tempfile
+import miniaudio
+import sounddevice
+import soundfile
 import threading
-import time
-import sys
+import collections
 
-def send_text_and_play_speech(server_ip, server_port, text, voice_name=None, 
-                             language_code=None, speaking_rate=None, save_file=None):
-    """Send text to server for TTS processing and play the returned audio"""
-    # Initialize pygame for audio playback
-    pygame.init()
-    pygame.mixer.init()
+LENGTH_PREFIX = struct.Struct(">I")  # 4-byte big-endian message length
+ENCODINGS = ["opus", "mp3"]  # Audio encodings the server can send
+STREAM_RATE = 24000  # Sample rate of streamed 16-bit mono PCM
+
+def send_msgs(sock, *payloads):
+    """Send one or more length-prefixed messages in a single write"""
+    sock.sendall(b"".join(LENGTH_PREFIX.pack(len(p)) + p for p in payloads))
+
+def recv_exact(sock, n):
+    """Receive exactly n bytes into a preallocated buffer"""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    off = 0
+    while off < n:
+        received = sock.recv_into(view[off:])
+        if not received:
+            raise ConnectionError("Connection closed by server")
+        off += received
+    return buf
+
+def recv_msg(sock):
+    """Receive a single length-prefixed message"""
+    (length,) = LENGTH_PREFIX.unpack(recv_exact(sock, LENGTH_PREFIX.size))
+    return recv_exact(sock, length)
+
+def decode_audio(audio_data, encoding="mp3"):
+    """Decode audio in memory, returning (float32 PCM bytes, sample rate, channels)"""
+    if encoding == "opus":
+        # libsndfile reads Ogg Opus directly
+        samples, sample_rate = soundfile.read(io.BytesIO(audio_data), dtype='float32',
+                                              always_2d=True)
+        return memoryview(samples).cast('B'), sample_rate, samples.shape[1]
+    decoded = miniaudio.mp3_read_f32(bytes(audio_data))
+    return memoryview(decoded.samples).cast('B'), decoded.sample_rate, decoded.nchannels
+
+def play_stream(sock):
+    """Play streamed 16-bit PCM frames as they arrive, returning all the audio once the stream ends"""
+    audio = bytearray()
+    try:
+        stream = sounddevice.RawOutputStream(samplerate=STREAM_RATE, channels=1, dtype='int16')
+        stream.start()
+    except Exception as e:
+        print(f"Error playing audio: {e}")
+        stream = None
+    
+    try:
+        # Read up to the end-of-audio frame even if playback fails, so the
+        # connection stays in step with the server
+        while True:
+            chunk = recv_msg(sock)
+            if not chunk:
+                break
+            audio += chunk
+            if stream is not None:
+                try:
+                    stream.write(chunk)
+                except Exception as e:
+                    # e.g. the device went away; keep draining the stream
+                    print(f"Error playing audio: {e}")
+                    try:
+                        stream.abort()
+                        stream.close()
+                    except Exception:
+                        pass
+                    stream = None
+    finally:
+        if stream is not None:
+            # Stopping lets the queued audio finish playing
+            try:
+                stream.stop()
+                stream.close()
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+    return audio
+
+def play_segments(sock, encoding="mp3"):
+    """Play each audio segment as it arrives until the end-of-audio frame, returning all the audio
+    
+    Segments are decoded as they land and queued on a single output stream,
+    so long texts play without a gap at each split.
+    """
+    audio = bytearray()
+    queued = collections.deque()  # Decoded segments not yet fully played
+    pos = 0  # Bytes of queued[0] already played
+    done = False
+    finished = threading.Event()
+    stream = None
     
+    def callback(outdata, frames, time_info, status):
+        """Copy the next block of queued audio to the device (runs on the audio thread)"""
+        nonlocal pos
+        filled = 0
+        while queued and filled < len(outdata):
+            pcm = queued[0]
+            n = min(len(outdata) - filled, len(pcm) - pos)
+            outdata[filled:filled + n] = pcm[pos:pos + n]
+            filled += n
+            pos += n
+            if pos == len(pcm):
+                queued.popleft()
+                pos = 0
+        if filled < len(outdata):
+            # Pad with silence until the next segment arrives, or let the
+            # stream drain once the last one has played
+            outdata[filled:] = bytes(len(outdata) - filled)
+            if done and not queued:
+                raise sounddevice.CallbackStop
+    
+    try:
+        # Read up to the end-of-audio frame even if playback fails, so the
+        # connection stays in step with the server
+        while True:
+            segment = recv_msg(sock)
+            if not segment:
+                break
+            audio += segment
+            try:
+                pcm, sample_rate, channels = decode_audio(segment, encoding)
+                # Every segment comes from the same voice and encoding, so the
+                # first one sets up the stream for the whole response
+                if stream is None:
+                    stream = sounddevice.RawOutputStream(samplerate=sample_rate,
+                                                         channels=channels,
+                                                         dtype='float32',
+                                                         callback=callback,
+                                                         finished_callback=finished.set)
+                    stream.start()
+                queued.append(pcm)
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+        
+        # Wait for playback to finish
+        done = True
+        if stream is not None and stream.active:
+            finished.wait()
+    finally:
+        if stream is not None:
+            stream.close()
+    return audio
+
+def save_pcm(path, pcm):
+    """Save streamed 16-bit PCM as a WAV file"""
+    with soundfile.SoundFile(path, 'w', samplerate=STREAM_RATE, channels=1,
+                             format='WAV', subtype='PCM_16') as f:
+        f.buffer_write(pcm, dtype='int16')
+
+def connect_to_server(server_ip, server_port):
+    """Connect to the TTS server, returning the socket or None on failure"""
     print(f"Connecting to server at {server_ip}:{server_port}...")
     
     # Create socket and connect to server
@@ -28,96 +170,63 @@ def send_text_and_play_speech(server_ip, server_port, text, voice_name=None,
         client_socket.connect((server_ip, server_port))
     except ConnectionRefusedError:
         print("Error: Could not connect to server. Make sure the server is running.")
-        return
-    
-    # Prepare request - add voice parameters if provided
-    if voice_name or language_code or speaking_rate:
-        request = f"VOICE_PARAMS||{voice_name or ''}||{language_code or ''}||{speaking_rate or ''}||{text}"
-    else:
-        request = text
-    
-    print(f"Sending text: '{text[:50]}...' (if longer)")
-    
-    # Send the text to the server
-    client_socket.sendall(request.encode('utf-8'))
-    client_socket.sendall(b"END_REQUEST")
-    
-    # Receive the audio data
-    print("Waiting for speech synthesis...")
-    
-    # First get the audio size
-    size_data = b""
-    while b'\n' not in size_data:
-        chunk = client_socket.recv(1024)
-        if not chunk:
-            break
-        size_data += chunk
-    
-    # Check for error message
-    size_str = size_data.split(b'\n')[0].decode('utf-8')
-    if size_str.startswith("ERROR:"):
-        print(size_str)
         client_socket.close()
-        return
+        return None
+    return client_socket
+
+def send_text_and_play_speech(server_ip, server_port, text, voice_name=None, 
+                             language_code=None, speaking_rate=None, save_file=None,
+                             sock=None, encoding="opus", stream=False):
+    """Send text to server for TTS processing and play the returned audio
     
-    try:
-        expected_size = int(size_str)
-        print(f"Expecting {expected_size} bytes of audio data")
-    except ValueError:
-        print("Error parsing audio size from server")
-        client_socket.close()
+    If sock is given the request is sent over that connection, which is left
+    open for further requests; otherwise a connection is made just for this one.
+    With stream set, audio is played as the server produces it rather than
+    a sentence-level segment at a time.
+    """
+    client_socket = sock or connect_to_server(server_ip, server_port)
+    if client_socket is None:
         return
     
-    # Get remaining data after the newline
-    audio_data = size_data.split(b'\n', 1)[1] if b'\n' in size_data else b""
-    
-    # Create a temporary file to store the audio
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-        temp_filename = temp_file.name
-        temp_file.write(audio_data)
+    try:
+        # Prepare request - unset voice parameters use the server's defaults
+        header = {"voice": voice_name, "lang": language_code, "rate": speaking_rate,
+                  "encoding": encoding, "stream": stream}
         
-        # Receive the rest of the audio data
-        while b"END_AUDIO" not in audio_data:
-            chunk = client_socket.recv(4096)
-            if not chunk:
-                break
-            
-            if b"END_AUDIO" in chunk:
-                audio_part = chunk.split(b"END_AUDIO")[0]
-                temp_file.write(audio_part)
-                break
-            else:
-                temp_file.write(chunk)
-    
-    client_socket.close()
+        print(f"Sending text: '{text[:50]}...' (if longer)")
+        
+        # Send the header and the text to the server
+        send_msgs(client_socket, json.dumps(header).encode('utf-8'), text.encode('utf-8'))
+        
+        # Receive the audio data
+        print("Waiting for speech synthesis...")
+        
+        # The server answers with the audio, one message per segment (or per
+        # chunk when streaming), which is played as it arrives, then an
+        # empty message and finally a status message
+        if stream:
+            audio_data = play_stream(client_socket)
+        else:
+            audio_data = play_segments(client_socket, encoding)
+        status = recv_msg(client_socket).decode('utf-8')
+        if status.startswith("ERROR:"):
+            print(status)
+            return
+        print(f"Received {len(audio_data)} bytes of audio data")
+    finally:
+        if sock is None:
+            client_socket.close()
     
     # Save the audio file if requested
     if save_file:
-        import shutil
-        shutil.copy2(temp_filename, save_file)
+        if stream:
+            save_pcm(save_file, audio_data)
+        else:
+            with open(save_file, 'wb') as f:
+                f.write(audio_data)
         print(f"Audio saved to {save_file}")
-    
-    # Play the audio
-    print("Playing audio...")
-    try:
-        pygame.mixer.music.load(temp_filename)
-        pygame.mixer.music.play()
-        
-        # Wait for playback to finish
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
-        
-    except Exception as e:
-        print(f"Error playing audio: {e}")
-    finally:
-        pygame.mixer.quit()
-        pygame.quit()
-        
-        # Clean up temporary file
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
 
-def interactive_mode(server_ip, server_port):
+def interactive_mode(server_ip, server_port, encoding="opus", stream=False):
     """Interactive mode for sending multiple text requests"""
     print("=== Interactive Text-to-Speech Mode ===")
     print("Type your text and press Enter to hear it spoken.")
@@ -128,10 +237,12 @@ def interactive_mode(server_ip, server_port):
     print("Type /exit or /quit to end the session")
     print("=======================================")
     
-    voice_name = "en-US-Neural2-F"  # default voice
+    # Streaming needs a Chirp 3 HD voice, so leave the choice to the server
+    voice_name = None if stream else "en-US-Neural2-F"  # default voice
     language_code = "en-US"         # default language
     speaking_rate = 1.0             # default rate
     save_file = None                # default: don't save
+    client_socket = None            # kept open for the whole session
     
     while True:
         try:
@@ -170,7 +281,7 @@ def interactive_mode(server_ip, server_port):
                     
                 elif cmd == "/info":
                     print(f"Current settings:")
-                    print(f"  Voice: {voice_name}")
+                    print(f"  Voice: {voice_name or 'server default'}")
                     print(f"  Language: {language_code}")
                     print(f"  Speaking rate: {speaking_rate}")
                     print(f"  Save to: {save_file or 'not saving'}")
@@ -184,16 +295,32 @@ def interactive_mode(server_ip, server_port):
             if not text:
                 continue
                 
+            # Connect on first use and reuse the connection for later lines
+            if client_socket is None:
+                client_socket = connect_to_server(server_ip, server_port)
+                if client_socket is None:
+                    continue
+            
             # Send text for speech synthesis
-            send_text_and_play_speech(
-                server_ip, 
-                server_port, 
-                text, 
-                voice_name=voice_name,
-                language_code=language_code, 
-                speaking_rate=speaking_rate,
-                save_file=save_file
-            )
+            try:
+                send_text_and_play_speech(
+                    server_ip, 
+                    server_port, 
+                    text, 
+                    voice_name=voice_name,
+                    language_code=language_code, 
+                    speaking_rate=speaking_rate,
+                    save_file=save_file,
+                    sock=client_socket,
+                    encoding=encoding,
+                    stream=stream
+                )
+            except OSError as e:
+                # Drop the broken connection; the next line reconnects
+                print(f"Connection error: {e}")
+                client_socket.close()
+                client_socket = None
+                continue
             
             # Reset save_file after using it once
             if save_file:
@@ -205,6 +332,9 @@ def interactive_mode(server_ip, server_port):
             break
         except Exception as e:
             print(f"Error: {e}")
+    
+    if client_socket is not None:
+        client_socket.close()
 
 def main():
     """Parse command line arguments and start client"""
@@ -225,13 +355,17 @@ def main():
                         help='Save audio to file')
     parser.add_argument('--interactive', '-i', action='store_true',
                         help='Enter interactive mode')
+    parser.add_argument('--encoding', '-e', choices=ENCODINGS, default='opus',
+                        help='Audio encoding to request (default: opus)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Play audio while it is synthesized (Chirp 3 HD voices, normal rate only)')
     
     args = parser.parse_args()
     
     try:
         # Interactive mode if no text provided or explicitly requested
         if args.interactive or args.text is None:
-            interactive_mode(args.server, args.port)
+            interactive_mode(args.server, args.port, args.encoding, args.stream)
         else:
             # Single text-to-speech conversion
             send_text_and_play_speech(
@@ -241,7 +375,9 @@ def main():
                 voice_name=args.voice,
                 language_code=args.language, 
                 speaking_rate=args.rate,
-                save_file=args.save
+                save_file=args.save,
+                encoding=args.encoding,
+                stream=args.stream
             )
     except KeyboardInterrupt:
         print("\nStopped by user")
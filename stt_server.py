@@ -4,14 +4,33 @@ Server script to run on Digital Ocean droplet
 Receives audio data from client and transcribes using Google Speech-to-Text API
 """
 import os
-import io
 import socket
-import wave
+import functools
+import struct
 import threading
+import selectors
+import collections
+import itertools
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from google.cloud import speech_v1 as speech
 from google.api_core.client_options import ClientOptions
 
+MAX_WORKERS = 16  # Maximum number of clients handled concurrently
+RECV_BUFFER = 1 << 16  # Initial size of the per-connection receive buffer
+MAX_MESSAGE = 1 << 16  # Largest message accepted from a client
+MAX_BUFFERED = 4 << 20  # Most audio a connection may have waiting for its worker
+AUDIO_TIMEOUT = 10  # Seconds a worker waits for audio before giving up on the client
+LENGTH_PREFIX = struct.Struct(">I")  # 4-byte big-endian message length
+SEND_IOVECS = 64  # Maximum buffers passed to a single sendmsg call
+
+# Audio encodings a client may announce in its format information
+ENCODINGS = {
+    "linear16": speech.RecognitionConfig.AudioEncoding.LINEAR16,
+    "flac": speech.RecognitionConfig.AudioEncoding.FLAC,
+}
+
 def load_environment():
     """Load environment variables from .env file"""
     load_dotenv()
@@ -22,102 +41,318 @@ def load_environment():
         raise EnvironmentError(f"Missing required environment variables: {', '.join(missing)}")
     print(f"Environment loaded successfully (using GOOGLE_API_KEY)")
 
-def transcribe_audio_file(audio_content, sample_rate_hertz=16000):
-    """Transcribe the given audio data using Google Speech-to-Text API with API key"""
-    # Set up client with API key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    client_options = ClientOptions(api_key=api_key)
-    client = speech.SpeechClient(client_options=client_options)
-    
-    # Configure audio settings
-    audio = speech.RecognitionAudio(content=audio_content)
+# Speech client shared by all connections (gRPC channels are thread-safe)
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the shared Speech-to-Text client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Set up client with API key
+                api_key = os.getenv("GOOGLE_API_KEY")
+                client_options = ClientOptions(api_key=api_key)
+                _client = speech.SpeechClient(client_options=client_options)
+    return _client
+
+@functools.lru_cache(maxsize=8)
+def get_streaming_config(sample_rate_hertz, encoding):
+    """Return the streaming recognition config for an audio format, building it once per format"""
     config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        encoding=encoding,
         sample_rate_hertz=sample_rate_hertz,
         language_code="en-US",
         enable_automatic_punctuation=True,
     )
+    return speech.StreamingRecognitionConfig(config=config, interim_results=False)
+
+def transcribe_stream(audio_chunks, sample_rate_hertz=16000,
+                      encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16):
+    """Stream audio chunks to Google Speech-to-Text and yield each result as text as it arrives"""
+    client = get_client()
+    
+    # Configure audio settings (shared between requests, so never modified)
+    streaming_config = get_streaming_config(sample_rate_hertz, encoding)
     
-    # Perform the transcription
-    print("Sending audio to Google Speech-to-Text API...")
-    response = client.recognize(config=config, audio=audio)
-    
-    # Process and return results
-    results = []
-    for result in response.results:
-        for alternative in result.alternatives:
-            results.append({
-                "transcript": alternative.transcript,
-                "confidence": alternative.confidence
-            })
-    
-    # Format results as text
-    result_text = ""
-    if not results:
-        result_text = "No transcription results returned. The audio might be silent or unclear."
-    else:
-        for i, result in enumerate(results, 1):
-            result_text += f"Result {i}:\n"
-            result_text += f"  Transcript: {result['transcript']}\n"
-            result_text += f"  Confidence: {result['confidence']:.4f}\n"
-    
-    return result_text
+    # gRPC pulls the requests from its own thread while we read the responses
+    requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in audio_chunks)
+    print("Streaming audio to Google Speech-to-Text API...")
+    responses = client.streaming_recognize(config=streaming_config, requests=requests)
+    
+    # Format each final result as text
+    count = 0
+    for response in responses:
+        for result in response.results:
+            if not result.is_final:
+                continue
+            for alternative in result.alternatives:
+                count += 1
+                result_text = f"Result {count}:\n"
+                result_text += f"  Transcript: {alternative.transcript}\n"
+                result_text += f"  Confidence: {alternative.confidence:.4f}\n"
+                yield result_text
+    
+    if not count:
+        yield "No transcription results returned. The audio might be silent or unclear."
 
-def handle_client(client_socket, client_address):
-    """Handle individual client connection"""
-    print(f"Connection from {client_address}")
+class ClientConnection:
+    """State of one non-blocking client connection driven by the selector loop
     
-    try:
-        # First receive the audio format information
-        format_info = client_socket.recv(1024).decode('utf-8')
-        rate, channels, sample_width = map(int, format_info.split(','))
-        print(f"Audio format: {rate}Hz, {channels} channels, {sample_width} bytes per sample")
-        
-        # Send acknowledgment
-        client_socket.sendall(b"ACK")
-        
-        # Receive audio data
-        print("Receiving audio data...")
-        audio_data = b""
+    The loop reads and parses messages as they arrive: first the audio format
+    (HEADER), then audio messages (AUDIO) until an empty one (DONE). Audio is
+    handed to a pooled worker through a queue; the worker queues its replies
+    in the outbox and calls notify() so the loop writes them out.
+    """
+    HEADER, AUDIO, DONE = range(3)
+    
+    def __init__(self, sock, address, pool, notify):
+        self.sock = sock
+        self.address = address
+        self.pool = pool
+        self.notify = notify
+        self.state = ClientConnection.HEADER
+        self.rate = None
+        self.encoding = None
+        self.received = 0
+        self.consumed = 0  # Audio bytes taken by the worker; only it writes this
+        self.buf = bytearray(RECV_BUFFER)
+        self.filled = 0
+        self.audio = queue.Queue()
+        self.outbox = collections.deque()
+        self.outbox_lock = threading.Lock()
+        self.reading = True
+        self.finished = False
+        self.closed = False
+    
+    def events(self):
+        """Selector events this connection is currently interested in"""
+        with self.outbox_lock:
+            pending = bool(self.outbox)
+        return ((selectors.EVENT_READ if self.reading else 0)
+                | (selectors.EVENT_WRITE if pending else 0))
+    
+    def send_msg(self, payload):
+        """Queue a length-prefixed message for the selector loop to send (thread-safe)"""
+        with self.outbox_lock:
+            self.outbox.append(memoryview(LENGTH_PREFIX.pack(len(payload))))
+            self.outbox.append(memoryview(payload))
+        self.notify(self)
+    
+    def finish(self):
+        """Close the connection once the outbox has been flushed (thread-safe)"""
+        self.finished = True
+        self.notify(self)
+    
+    def audio_chunks(self):
+        """Yield the client's audio messages as they arrive (runs on the worker)"""
         while True:
-            chunk = client_socket.recv(4096)
-            if b"END" in chunk:
-                audio_data += chunk.split(b"END")[0]
-                break
-            if not chunk:
-                break
-            audio_data += chunk
-        
-        print(f"Received {len(audio_data)} bytes of audio data")
-        
-        # Save the received audio to a temporary WAV file
-        temp_file = f"received_{client_address[0]}_{client_address[1]}.wav"
-        with wave.open(temp_file, 'wb') as wf:
-            wf.setnchannels(channels)
-            wf.setsampwidth(sample_width)
-            wf.setframerate(rate)
-            wf.writeframes(audio_data)
+            # Don't let a quiet client hold the pooled thread indefinitely
+            try:
+                chunk = self.audio.get(timeout=AUDIO_TIMEOUT)
+            except queue.Empty:
+                raise TimeoutError(f"No audio received for {AUDIO_TIMEOUT} seconds") from None
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            self.consumed += len(chunk)
+            yield chunk
+    
+    def on_readable(self):
+        """Receive whatever is available and process every complete message"""
+        received = self.sock.recv_into(memoryview(self.buf)[self.filled:])
+        if not received:
+            if self.state != ClientConnection.DONE:
+                raise ConnectionError("Connection closed by client")
+            # The client has sent everything and only shut down its side;
+            # stop reading and let finish() close once the results are out
+            self.reading = False
+            return
+        self.filled += received
         
-        # Read the file in a format compatible with Google's API
-        with open(temp_file, 'rb') as audio_file:
-            audio_content = audio_file.read()
+        pos = 0
+        while self.filled - pos >= LENGTH_PREFIX.size:
+            (length,) = LENGTH_PREFIX.unpack_from(self.buf, pos)
+            if length > MAX_MESSAGE:
+                raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE} byte limit")
+            end = pos + LENGTH_PREFIX.size + length
+            if end > self.filled:
+                break
+            self.on_message(bytes(memoryview(self.buf)[pos + LENGTH_PREFIX.size:end]))
+            pos = end
         
-        # Transcribe the audio
-        transcription = transcribe_audio_file(audio_content, rate)
+        # Move the incomplete tail to the front, growing the buffer if the
+        # next message won't fit in it
+        remaining = self.filled - pos
+        if pos:
+            self.buf[:remaining] = self.buf[pos:self.filled]
+            self.filled = remaining
+        needed = LENGTH_PREFIX.size
+        if remaining >= LENGTH_PREFIX.size:
+            needed += LENGTH_PREFIX.unpack_from(self.buf)[0]
+        if needed > len(self.buf):
+            self.buf.extend(bytes(needed - len(self.buf)))
+    
+    def on_message(self, payload):
+        """Advance the protocol state machine with one received message"""
+        if self.state == ClientConnection.HEADER:
+            # First receive the audio format information
+            codec, rate, channels, sample_width = payload.decode('utf-8').split(',')
+            rate, channels, sample_width = int(rate), int(channels), int(sample_width)
+            if codec not in ENCODINGS:
+                raise ValueError(f"Unsupported audio codec: {codec}")
+            print(f"Audio format: {codec}, {rate}Hz, {channels} channels, {sample_width} bytes per sample")
+            self.rate = rate
+            self.encoding = ENCODINGS[codec]
+            self.state = ClientConnection.AUDIO
+            
+            # Send acknowledgment and start streaming to the API right away
+            self.send_msg(b"ACK")
+            print("Receiving audio data...")
+            self.pool.submit(handle_client, self)
+        elif self.state == ClientConnection.AUDIO:
+            if payload:
+                self.received += len(payload)
+                if self.received - self.consumed > MAX_BUFFERED:
+                    raise ValueError(f"More than {MAX_BUFFERED} bytes of audio waiting to be transcribed")
+                self.audio.put(payload)
+            else:
+                print(f"Received {self.received} bytes of audio data")
+                self.state = ClientConnection.DONE
+                self.audio.put(None)
+    
+    def on_writable(self):
+        """Send as much of the outbox as the socket will take"""
+        with self.outbox_lock:
+            # Hand the queued buffers to the kernel in one scatter-gather
+            # write instead of copying them together first
+            if hasattr(self.sock, "sendmsg"):
+                sent = self.sock.sendmsg(itertools.islice(self.outbox, SEND_IOVECS))
+            else:
+                sent = self.sock.send(self.outbox[0])
+            while self.outbox and sent >= len(self.outbox[0]):
+                sent -= len(self.outbox.popleft())
+            if sent:
+                self.outbox[0] = self.outbox[0][sent:]
+    
+    def close(self):
+        """Close the socket and stop a worker still waiting for audio"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.state != ClientConnection.DONE:
+            self.audio.put(ConnectionError("Connection closed by client"))
+        self.sock.close()
+        print(f"Connection with {self.address} closed")
+
+def handle_client(conn):
+    """Transcribe a client's audio as it arrives (runs on a pooled thread)"""
+    try:
+        # Stream audio to the API and relay each result to the client as soon
+        # as it lands; an empty message ends the results
+        for result_text in transcribe_stream(conn.audio_chunks(), conn.rate, conn.encoding):
+            conn.send_msg(result_text.encode('utf-8'))
+        conn.send_msg(b"")
         print("Transcription completed")
-        
-        # Send the transcription back to the client
-        client_socket.sendall(transcription.encode('utf-8'))
-        client_socket.sendall(b"END_TRANSCRIPTION")
-        
-        # Clean up temporary file
-        os.remove(temp_file)
-        
     except Exception as e:
-        print(f"Error handling client {client_address}: {e}")
+        print(f"Error handling client {conn.address}: {e}")
     finally:
-        client_socket.close()
-        print(f"Connection with {client_address} closed")
+        conn.finish()
+
+def serve_forever(server_socket, pool):
+    """Run the selector loop that accepts clients and does all socket I/O"""
+    selector = selectors.DefaultSelector()
+    server_socket.setblocking(False)
+    selector.register(server_socket, selectors.EVENT_READ)
+    
+    # Workers wake the loop through this socket pair when they queue output
+    wakeup_recv, wakeup_send = socket.socketpair()
+    wakeup_recv.setblocking(False)
+    wakeup_send.setblocking(False)
+    selector.register(wakeup_recv, selectors.EVENT_READ)
+    ready = collections.deque()
+    connections = set()  # Every open client, registered or waiting on its worker
+    
+    def notify(conn):
+        ready.append(conn)
+        try:
+            wakeup_send.send(b"\0")
+        except BlockingIOError:
+            pass  # The loop already has wakeups pending
+    
+    def update(conn):
+        """Re-register a connection for the right events, or close it"""
+        if conn.closed:
+            return
+        # Read finished first: the worker sets it after queueing its last
+        # output, so an empty outbox seen afterwards really is empty
+        finished = conn.finished
+        events = conn.events()
+        registered = conn.sock in selector.get_map()
+        if finished and not events & selectors.EVENT_WRITE:
+            if registered:
+                selector.unregister(conn.sock)
+            conn.close()
+            connections.discard(conn)
+        elif not events:
+            # Half-closed with nothing to send yet; the worker's next
+            # notify() brings the connection back
+            if registered:
+                selector.unregister(conn.sock)
+        elif registered:
+            selector.modify(conn.sock, events, conn)
+        else:
+            selector.register(conn.sock, events, conn)
+    
+    try:
+        while True:
+            for key, events in selector.select():
+                if key.fileobj is server_socket:
+                    # Accept client connection
+                    try:
+                        client_socket, client_address = server_socket.accept()
+                    except BlockingIOError:
+                        continue
+                    print(f"Connection from {client_address}")
+                    client_socket.setblocking(False)
+                    conn = ClientConnection(client_socket, client_address, pool, notify)
+                    selector.register(client_socket, selectors.EVENT_READ, conn)
+                    connections.add(conn)
+                elif key.fileobj is wakeup_recv:
+                    # Pick up output queued by the workers
+                    try:
+                        while wakeup_recv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    while ready:
+                        update(ready.popleft())
+                else:
+                    conn = key.data
+                    try:
+                        if events & selectors.EVENT_READ:
+                            conn.on_readable()
+                        if events & selectors.EVENT_WRITE:
+                            conn.on_writable()
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except Exception as e:
+                        print(f"Error handling client {conn.address}: {e}")
+                        selector.unregister(conn.sock)
+                        conn.close()
+                        connections.discard(conn)
+                        continue
+                    update(conn)
+    finally:
+        # Closing the clients also stops workers blocked waiting for audio,
+        # so the pool's threads can exit
+        for conn in connections:
+            conn.close()
+        selector.close()
+        wakeup_recv.close()
+        wakeup_send.close()
 
 def start_server(port=12345):
     """Start the server to listen for incoming audio data"""
@@ -137,21 +372,15 @@ def start_server(port=12345):
     server_socket.listen(5)
     print(f"Server listening on port {port}...")
     
+    # Socket I/O runs on the selector loop; the API calls run on a bounded pool
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="stt")
+    
     try:
-        while True:
-            # Accept client connection
-            client_socket, client_address = server_socket.accept()
-            
-            # Handle client in a new thread
-            client_thread = threading.Thread(
-                target=handle_client, 
-                args=(client_socket, client_address)
-            )
-            client_thread.daemon = True
-            client_thread.start()
+        serve_forever(server_socket, pool)
     except KeyboardInterrupt:
         print("\nServer stopped by user")
     finally:
+        pool.shutdown(wait=False, cancel_futures=True)
         server_socket.close()
 
 if __name__ == "__main__":
@@ -4,11 +4,11 @@ Test script for Google's Speech-to-Text API using microphone input
 Records audio from the microphone and sends it to Google's API for transcription
 """
 import os
-import io
 import time
+import sys
 import pyaudio
+import atexit
 import wave
-import threading
 from dotenv import load_dotenv
 from google.cloud import speech_v1 as speech
 from google.api_core.client_options import ClientOptions
@@ -20,6 +20,17 @@ FORMAT = pyaudio.paInt16  # 16-bit audio
 CHANNELS = 1  # Mono audio
 RECORD_SECONDS = 5  # Duration to record (adjust as needed)
 
+# PyAudio instance shared by all recordings (PortAudio is set up only once)
+_pa = None
+
+def get_pyaudio():
+    """Return the shared PyAudio instance, creating it on first use"""
+    global _pa
+    if _pa is None:
+        _pa = pyaudio.PyAudio()
+        atexit.register(_pa.terminate)
+    return _pa
+
 def load_environment():
     """Load environment variables from .env file"""
     load_dotenv()
@@ -32,7 +43,7 @@ def load_environment():
 
 def record_audio(output_filename="recording.wav"):
     """Record audio from the microphone and save to a WAV file"""
-    p = pyaudio.PyAudio()
+    p = get_pyaudio()
     
     # Open audio stream
     stream = p.open(format=FORMAT,
@@ -45,20 +56,28 @@ def record_audio(output_filename="recording.wav"):
     frames = []
     
     # Start recording with a visual indicator
+    show_progress = sys.stdout.isatty()
+    last_print = 0.0
+    ticks = 0
     for i in range(0, int(RATE / CHUNK * RECORD_SECONDS)):
         data = stream.read(CHUNK)
         frames.append(data)
-        # Print a simple progress indicator
-        if i % 10 == 0:
-            dots = "." * (i // 10 % 4)
-            print(f"\rRecording{dots:<3}", end="")
+        # Print a simple progress indicator, at most once a second and only
+        # to a terminal
+        if show_progress:
+            now = time.monotonic()
+            if now - last_print >= 1.0:
+                last_print = now
+                dots = "." * (ticks % 4)
+                sys.stdout.write(f"\rRecording{dots:<3}")
+                sys.stdout.flush()
+                ticks += 1
     
     print("\nFinished recording!")
     
     # Stop and close the stream
     stream.stop_stream()
     stream.close()
-    p.terminate()
     
     # Save the recorded audio as a WAV file
     wf = wave.open(output_filename, 'wb')
@@ -78,7 +97,7 @@ def transcribe_audio_file(file_path):
     client = speech.SpeechClient(client_options=client_options)
     
     # Read audio file
-    with io.open(file_path, "rb") as audio_file:
+    with open(file_path, "rb") as audio_file:
         content = audio_file.read()
     
     # Configure audio settings
@@ -16,38 +16,26 @@ def test_google_api():
         print("Error: GOOGLE_API_KEY not found in .env file")
         return False
     
-    # Speech-to-Text API endpoint for testing
-    url = f"https://speech.googleapis.com/v1/speech:recognize?key={api_key}"
-    
-    # Simple request to test API key (this won't actually transcribe anything)
-    payload = {
-        "config": {
-            "encoding": "LINEAR16",
-            "sampleRateHertz": 16000,
-            "languageCode": "en-US"
-        },
-        "audio": {
-            "content": "" # Empty content for testing purposes
-        }
-    }
+    # Fetch the Speech-to-Text discovery document with the key attached. It's
+    # a cheap GET that still has the key checked, without running a
+    # recognition request or using up quota
+    url = f"https://speech.googleapis.com/$discovery/rest?version=v1&key={api_key}"
     
     # Send request
-    response = requests.post(url, json=payload)
+    response = requests.get(url)
     
     # Check if API key is valid
-    if response.status_code == 400:
-        # 400 means the request was malformed (expected with empty audio)
-        # but the API key was accepted
-        print("API key is valid! The 400 error is expected (empty audio content).")
-        print("Response:", response.json())
+    if response.status_code == 200:
+        print("API key is valid!")
         return True
-    elif response.status_code == 403:
+    elif response.status_code in (400, 401, 403):
+        # Google rejects malformed or unknown keys with 400, unauthorized ones with 401/403
         print("API key is invalid or doesn't have access to Speech-to-Text API")
         print("Response:", response.json())
         return False
     else:
         print(f"Unexpected status code: {response.status_code}")
-        print("Response:", response.json())
+        print("Response:", response.text)
         return False
 
 if __name__ == "__main__":
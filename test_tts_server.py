@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the TTS server builds valid Text-to-Speech request messages
+for the installed google-cloud-texttospeech release (no API key or network needed)
+"""
+from google.cloud import texttospeech
+import tts_server
+
+def test_audio_configs():
+    """Build the audio config for every encoding a client may request"""
+    for encoding, (audio_encoding, sample_rate_hertz) in tts_server.ENCODINGS.items():
+        audio_config = tts_server.get_audio_config(1.25, encoding)
+        assert audio_config.audio_encoding == audio_encoding
+        assert audio_config.speaking_rate == 1.25
+        if sample_rate_hertz:
+            assert audio_config.sample_rate_hertz == sample_rate_hertz
+
+def test_streaming_config():
+    """Build the streaming config and the requests that carry it"""
+    streaming_config = tts_server.get_streaming_config(tts_server.STREAM_VOICE, "en-US")
+    assert streaming_config.voice.name == tts_server.STREAM_VOICE
+    assert streaming_config.streaming_audio_config.audio_encoding == texttospeech.AudioEncoding.PCM
+    assert streaming_config.streaming_audio_config.sample_rate_hertz == tts_server.STREAM_RATE
+    texttospeech.StreamingSynthesizeRequest(streaming_config=streaming_config)
+    texttospeech.StreamingSynthesizeRequest(
+        input=texttospeech.StreamingSynthesisInput(text="hello")
+    )
+
+if __name__ == "__main__":
+    test_audio_configs()
+    test_streaming_config()
+    print("Request messages built successfully!")
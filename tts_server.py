@@ -5,14 +5,73 @@ Receives text from client and synthesizes speech using Google Text-to-Speech API
 Then sends the audio data back to the client for playback
 """
 import os
-import io
+import atexit
+import sys
+import re
+import json
 import socket
-import threading
+import signal
+import time
+import struct
+import queue
+import asyncio
+import logging
+import logging.handlers
 import argparse
+import functools
+import collections
 from dotenv import load_dotenv
 from google.cloud import texttospeech
 from google.api_core.client_options import ClientOptions
 
+LENGTH_PREFIX = struct.Struct(">I")  # 4-byte big-endian message length
+CACHE_BYTES = 64 << 20  # Maximum total size of cached audio
+MAX_REQUEST = 1 << 20  # Largest request body accepted from a client
+ADMIT_TIMEOUT = 0.1  # Seconds to wait for a free slot before turning a request away
+SEGMENT_CHARS = 400  # Target length of the text segments synthesized concurrently
+SEGMENT_WINDOW = 4  # Segments of one request synthesized at the same time
+STOP_GRACE = 5  # Seconds workers get to exit after an interrupt before they are terminated
+SENTENCE_END = re.compile(r"[.!?]+\s+")  # Where long text may be split
+
+# Options applied to the listening socket and to every accepted connection:
+# send each response as soon as it is written, with room for a whole MP3
+SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_SNDBUF, 262144),
+]
+
+STREAM_VOICE = "en-US-Chirp3-HD-Charon"  # Default voice for streamed requests (Chirp 3 HD only)
+STREAM_RATE = 24000  # Sample rate of streamed 16-bit mono PCM
+
+# Audio encodings a client may ask for, with the sample rate to request
+# (None keeps the voice's natural rate); Opus is about half the size of MP3
+ENCODINGS = {
+    "mp3": (texttospeech.AudioEncoding.MP3, None),
+    "opus": (texttospeech.AudioEncoding.OGG_OPUS, 24000),
+}
+
+# Synthesized audio keyed by (text, voice_name, language_code, speaking_rate, encoding),
+# least recently used first (only touched from the event loop, so no lock)
+_audio_cache = collections.OrderedDict()
+_audio_cache_bytes = 0
+
+# Records are handed to a queue and written out by a background thread, so
+# request handling never blocks on console or file I/O
+log = logging.getLogger("tts_server")
+
+def setup_logging():
+    """Route log records through a queue to a background writer, flushed at exit"""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(process)d] %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+
 def load_environment():
     """Load environment variables from .env file"""
     load_dotenv()
@@ -21,119 +80,333 @@ def load_environment():
     missing = [var for var in required_vars if not os.getenv(var)]
     if missing:
         raise EnvironmentError(f"Missing required environment variables: {', '.join(missing)}")
-    print(f"Environment loaded successfully (using GOOGLE_API_KEY)")
+    log.info("Environment loaded successfully (using GOOGLE_API_KEY)")
 
-def synthesize_text(text, voice_name="en-US-Neural2-F", language_code="en-US", speaking_rate=1.0):
-    """Convert text to speech using Google Text-to-Speech API with API key"""
-    # Set up client with API key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    client_options = ClientOptions(api_key=api_key)
-    client = texttospeech.TextToSpeechClient(client_options=client_options)
-    
-    # Build the synthesis input
-    synthesis_input = texttospeech.SynthesisInput(text=text)
-    
-    # Build the voice request
-    voice = texttospeech.VoiceSelectionParams(
+def get_cached_audio(key):
+    """Return cached audio for key, or None if it has not been synthesized yet"""
+    audio = _audio_cache.get(key)
+    if audio is not None:
+        _audio_cache.move_to_end(key)
+    return audio
+
+def cache_audio(key, audio):
+    """Store synthesized audio, evicting the least recently used entries to stay under CACHE_BYTES"""
+    global _audio_cache_bytes
+    if len(audio) > CACHE_BYTES:
+        return
+    old = _audio_cache.pop(key, None)
+    if old is not None:
+        _audio_cache_bytes -= len(old)
+    _audio_cache[key] = audio
+    _audio_cache_bytes += len(audio)
+    while _audio_cache_bytes > CACHE_BYTES:
+        _, evicted = _audio_cache.popitem(last=False)
+        _audio_cache_bytes -= len(evicted)
+
+# Text-to-Speech client shared by all connections; the async client binds to
+# the event loop it is created on, so it is made from inside the running loop
+_client = None
+
+def get_client():
+    """Return the shared Text-to-Speech client, creating it on first use"""
+    global _client
+    if _client is None:
+        # Set up client with API key
+        api_key = os.getenv("GOOGLE_API_KEY")
+        client_options = ClientOptions(api_key=api_key)
+        _client = texttospeech.TextToSpeechAsyncClient(client_options=client_options)
+    return _client
+
+@functools.lru_cache(maxsize=64)
+def get_voice(voice_name, language_code):
+    """Return the voice selection for a voice and language, building it once per pair"""
+    return texttospeech.VoiceSelectionParams(
         language_code=language_code,
         name=voice_name
     )
-    
-    # Select the audio config
+
+@functools.lru_cache(maxsize=64)
+def get_audio_config(speaking_rate, encoding="mp3"):
+    """Return the audio config for a speaking rate and encoding, building it once per pair"""
+    audio_encoding, sample_rate_hertz = ENCODINGS[encoding]
     audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3,
+        audio_encoding=audio_encoding,
         speaking_rate=speaking_rate
     )
+    if sample_rate_hertz:
+        audio_config.sample_rate_hertz = sample_rate_hertz
+    return audio_config
+
+@functools.lru_cache(maxsize=64)
+def get_streaming_config(voice_name, language_code):
+    """Return the streaming synthesis config for a voice and language, building it once per pair"""
+    # The streaming audio config has no speaking rate, so streamed speech is
+    # always at the voice's normal rate
+    return texttospeech.StreamingSynthesizeConfig(
+        voice=get_voice(voice_name, language_code),
+        streaming_audio_config=texttospeech.StreamingAudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.PCM,
+            sample_rate_hertz=STREAM_RATE
+        )
+    )
+
+async def synthesize_text(text, voice_name="en-US-Neural2-F", language_code="en-US", speaking_rate=1.0,
+                          encoding="mp3"):
+    """Convert text to speech using Google Text-to-Speech API with API key"""
+    # Repeated requests are served from the cache without calling the API
+    key = (text, voice_name, language_code, speaking_rate, encoding)
+    audio = get_cached_audio(key)
+    if audio is not None:
+        log.info("Cache hit for: '%s...' (if longer)", text[:50])
+        return audio
     
-    # Perform the text-to-speech request
-    print(f"Synthesizing speech for: '{text[:50]}...' (if longer)")
-    response = client.synthesize_speech(
-        input=synthesis_input, voice=voice, audio_config=audio_config
+    # Only the input is built per call; the voice and audio config are shared
+    # between requests, so never modified
+    log.info("Synthesizing speech for: '%s...' (if longer)", text[:50])
+    response = await get_client().synthesize_speech(
+        input=texttospeech.SynthesisInput(text=text),
+        voice=get_voice(voice_name, language_code),
+        audio_config=get_audio_config(speaking_rate, encoding)
     )
     
-    # Return the audio content
+    # Cache and return the audio content
+    cache_audio(key, response.audio_content)
     return response.audio_content
 
-def handle_client(client_socket, client_address):
+async def synthesize_stream(text, voice_name=STREAM_VOICE, language_code="en-US"):
+    """Convert text to speech with the streaming API, yielding raw PCM chunks as they are produced"""
+    # Repeated requests are served from the cache as a single chunk
+    key = (text, voice_name, language_code, 1.0, "pcm")
+    audio = get_cached_audio(key)
+    if audio is not None:
+        log.info("Cache hit for: '%s...' (if longer)", text[:50])
+        yield audio
+        return
+    
+    # The first request carries the config, the second the text
+    streaming_config = get_streaming_config(voice_name, language_code)
+    
+    async def requests():
+        yield texttospeech.StreamingSynthesizeRequest(streaming_config=streaming_config)
+        yield texttospeech.StreamingSynthesizeRequest(
+            input=texttospeech.StreamingSynthesisInput(text=text)
+        )
+    
+    # Hand each chunk on as soon as it arrives, keeping a copy for the cache
+    log.info("Streaming speech for: '%s...' (if longer)", text[:50])
+    chunks = []
+    responses = await get_client().streaming_synthesize(requests=requests())
+    async for response in responses:
+        if response.audio_content:
+            chunks.append(response.audio_content)
+            yield response.audio_content
+    cache_audio(key, b"".join(chunks))
+
+def split_text(text, max_chars=SEGMENT_CHARS):
+    """Split text at sentence ends into segments of up to max_chars (longer sentences stay whole)"""
+    # Cut after each run of sentence-ending punctuation and its whitespace
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    sentences.append(text[start:])
+    
+    # Coalesce consecutive sentences while they fit
+    segments = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + len(sentence) > max_chars:
+            segments.append(current.strip())
+            current = ""
+        current += sentence
+    if current.strip():
+        segments.append(current.strip())
+    return segments or [text]
+
+def frame(*payloads):
+    """Return the buffers for a sequence of length-prefixed messages"""
+    buffers = []
+    for payload in payloads:
+        buffers.append(LENGTH_PREFIX.pack(len(payload)))
+        buffers.append(payload)
+    return buffers
+
+async def send_msgs(writer, *payloads):
+    """Send one or more length-prefixed messages in a single write"""
+    writer.writelines(frame(*payloads))
+    await writer.drain()
+
+async def recv_frame(reader):
+    """Receive one length-prefixed frame, or None if the client disconnects before it starts"""
+    try:
+        header = await reader.readexactly(LENGTH_PREFIX.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError("Connection closed in the middle of a request")
+    (length,) = LENGTH_PREFIX.unpack(header)
+    if length > MAX_REQUEST:
+        raise ValueError(f"Request of {length} bytes exceeds the {MAX_REQUEST} byte limit")
+    
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed in the middle of a request")
+
+async def recv_request(reader):
+    """Receive the next request as (params, text), or None once the client disconnects
+    
+    A request is a JSON header frame holding the voice settings, followed by
+    a frame with the UTF-8 text to speak.
+    """
+    header = await recv_frame(reader)
+    if header is None:
+        return None
+    params = json.loads(header)
+    if not isinstance(params, dict):
+        raise ValueError("Request header must be a JSON object")
+    
+    body = await recv_frame(reader)
+    if body is None:
+        raise ConnectionError("Connection closed in the middle of a request")
+    return params, body.decode('utf-8')
+
+async def handle_request(writer, client_address, params, request_text):
+    """Synthesize a single request and send the response
+    
+    The response is one frame per audio segment (or PCM chunk when streaming),
+    an empty frame marking the end of the audio, then the status frame.
+    """
+    # Voice settings from the header, falling back to the defaults
+    stream = bool(params.get("stream"))
+    voice_name = params.get("voice") or (STREAM_VOICE if stream else "en-US-Neural2-F")
+    language_code = params.get("lang") or "en-US"
+    try:
+        speaking_rate = float(params.get("rate") or 1.0)
+    except (TypeError, ValueError):
+        speaking_rate = 1.0
+    # Unknown encodings fall back to MP3, which every client can play
+    encoding = params.get("encoding")
+    if encoding not in ENCODINGS:
+        encoding = "mp3"
+    
+    log.info("Received text: '%s...' (if longer)", request_text[:50])
+    log.info("Voice settings: %s, %s, rate=%s, encoding=%s",
+             voice_name, language_code, speaking_rate, encoding)
+    
+    if stream:
+        if speaking_rate != 1.0:
+            await send_msgs(writer, b"", b"ERROR: Streamed requests only support a speaking rate of 1.0")
+            return
+        await stream_request(writer, client_address, request_text, voice_name, language_code)
+        return
+    
+    # Synthesize the segments concurrently, sending each one in order as soon
+    # as it and all the segments before it are ready
+    segments = split_text(request_text)
+    pending = collections.deque()  # Segments being synthesized, in order
+    started = 0
+    status = b"OK"
+    audio_size = 0
+    last = []  # The final segment goes out in the same write as the trailer
+    try:
+        for i in range(len(segments)):
+            # Keep a few segments synthesizing ahead of the one being sent
+            # rather than starting them all at once
+            while started < len(segments) and len(pending) < SEGMENT_WINDOW:
+                pending.append(asyncio.create_task(synthesize_text(
+                    segments[started],
+                    voice_name=voice_name,
+                    language_code=language_code,
+                    speaking_rate=speaking_rate,
+                    encoding=encoding
+                )))
+                started += 1
+            audio_content = await pending[0]
+            pending.popleft()
+            audio_size += len(audio_content)
+            if i + 1 < len(segments):
+                await send_msgs(writer, audio_content)
+            else:
+                last.append(audio_content)
+    except OSError:
+        # The client went away; nothing more can be sent
+        raise
+    except Exception as e:
+        error_msg = f"Error synthesizing speech: {str(e)}"
+        log.error("%s", error_msg)
+        status = f"ERROR: {error_msg}".encode('utf-8')
+    finally:
+        # Drop whatever is still in flight after a failure
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    await send_msgs(writer, *last, b"", status)
+    log.info("Sent %d bytes of audio data in %d segment(s) to %s",
+             audio_size, len(segments), client_address)
+
+async def stream_request(writer, client_address, text, voice_name, language_code):
+    """Synthesize a streamed request, forwarding audio to the client while it is produced"""
+    status = b"OK"
+    audio_size = 0
+    try:
+        async for chunk in synthesize_stream(text, voice_name, language_code):
+            await send_msgs(writer, chunk)
+            audio_size += len(chunk)
+    except OSError:
+        # The client went away; nothing more can be sent
+        raise
+    except Exception as e:
+        error_msg = f"Error synthesizing speech: {str(e)}"
+        log.error("%s", error_msg)
+        status = f"ERROR: {error_msg}".encode('utf-8')
+    
+    await send_msgs(writer, b"", status)
+    log.info("Streamed %d bytes of audio data to %s", audio_size, client_address)
+
+async def handle_client(reader, writer, slots):
     """Handle individual client connection"""
-    print(f"Connection from {client_address}")
+    client_address = writer.get_extra_info('peername')
+    sock = writer.get_extra_info('socket')
+    for option in SOCKET_OPTIONS:
+        sock.setsockopt(*option)
+    log.info("Connection from %s", client_address)
     
     try:
-        # Receive the TTS request
-        data = b""
+        # Serve requests until the client disconnects, so one connection can
+        # carry a whole interactive session
         while True:
-            chunk = client_socket.recv(4096)
-            if b"END_REQUEST" in chunk:
-                data += chunk.split(b"END_REQUEST")[0]
+            request = await recv_request(reader)
+            if request is None:
                 break
-            if not chunk:
-                break
-            data += chunk
-        
-        # Parse the request
-        request_text = data.decode('utf-8')
-        
-        # Check if the request has voice parameters (JSON format)
-        voice_name = "en-US-Neural2-F"  # default
-        language_code = "en-US"  # default
-        speaking_rate = 1.0  # default
-        
-        # Split the request if it contains voice parameters
-        # Format: VOICE_PARAMS||voice_name||language_code||speaking_rate||TEXT
-        if "VOICE_PARAMS||" in request_text:
-            parts = request_text.split("||", 4)
-            if len(parts) >= 4:
-                voice_name = parts[1] or voice_name
-                language_code = parts[2] or language_code
-                try:
-                    speaking_rate = float(parts[3]) if parts[3] else speaking_rate
-                except ValueError:
-                    pass
-                request_text = parts[4] if len(parts) > 4 else ""
-        
-        print(f"Received text: '{request_text[:50]}...' (if longer)")
-        print(f"Voice settings: {voice_name}, {language_code}, rate={speaking_rate}")
-        
-        # Generate speech from text
-        try:
-            audio_content = synthesize_text(
-                request_text, 
-                voice_name=voice_name,
-                language_code=language_code,
-                speaking_rate=speaking_rate
-            )
-            
-            # Send audio size first for the client to prepare
-            audio_size = len(audio_content)
-            client_socket.sendall(f"{audio_size}\n".encode('utf-8'))
-            
-            # Send the audio data
-            client_socket.sendall(audio_content)
-            client_socket.sendall(b"END_AUDIO")
-            
-            print(f"Sent {audio_size} bytes of audio data to {client_address}")
-            
-        except Exception as e:
-            error_msg = f"Error synthesizing speech: {str(e)}"
-            print(error_msg)
-            client_socket.sendall(f"ERROR: {error_msg}".encode('utf-8'))
             
+            # A slot is held only while a request is being synthesized, so
+            # idle sessions don't lock out other clients; turn the request
+            # away if the server is saturated
+            try:
+                await asyncio.wait_for(slots.acquire(), ADMIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                log.warning("Server busy, rejecting request from %s", client_address)
+                await send_msgs(writer, b"", b"ERROR: busy")
+                continue
+            try:
+                await handle_request(writer, client_address, *request)
+            finally:
+                slots.release()
+        
     except Exception as e:
-        print(f"Error handling client {client_address}: {e}")
+        log.error("Error handling client %s: %s", client_address, e)
     finally:
-        client_socket.close()
-        print(f"Connection with {client_address} closed")
+        writer.close()
+        log.info("Connection with %s closed", client_address)
 
-def list_available_voices():
+async def list_available_voices():
     """List all available voices from Google TTS API"""
     try:
-        # Set up client with API key
-        api_key = os.getenv("GOOGLE_API_KEY")
-        client_options = ClientOptions(api_key=api_key)
-        client = texttospeech.TextToSpeechClient(client_options=client_options)
-        
         # List all available voices
-        voices = client.list_voices()
+        voices = await get_client().list_voices()
         
         print("Available voices:")
         for voice in voices.voices:
@@ -144,55 +417,147 @@ def list_available_voices():
             print(f"  Gender: {gender}")
             print(f"  Natural sample rate: {voice.natural_sample_rate_hertz}Hz")
             print()
-            
+        
     except Exception as e:
-        print(f"Error listing voices: {e}")
+        log.error("Error listing voices: %s", e)
 
-def start_server(port=12345, list_voices=False):
-    """Start the server to listen for incoming text requests"""
-    # Load environment variables
-    load_environment()
+# Tasks started without an awaiting caller, referenced here until they finish
+# so they aren't garbage collected while running
+_background_tasks = set()
+
+async def warm_up(phrases):
+    """Synthesize common phrases into the cache so their first request is served without an API call"""
+    # The first call also opens the gRPC channel, so real clients find it warm
+    results = await asyncio.gather(
+        *(synthesize_text(phrase, encoding=encoding)
+          for phrase in phrases for encoding in ENCODINGS),
+        return_exceptions=True
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        log.warning("Warm-up failed for %d of %d clips: %s", len(failures), len(results), failures[0])
+    else:
+        log.info("Warmed the cache with %d phrases in %d encodings", len(phrases), len(ENCODINGS))
+
+async def serve(server_socket, list_voices=False):
+    """Serve clients on the listening socket from a single event loop"""
+    # Create the API client up front so the first request doesn't pay for it,
+    # and fill the cache with common phrases in the background
+    get_client()
+    phrases = [p.strip() for p in os.getenv("WARMUP_PHRASES", "hello,yes,no").split(",") if p.strip()]
+    if phrases:
+        task = asyncio.create_task(warm_up(phrases))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
     
     # List available voices if requested
     if list_voices:
-        list_available_voices()
+        await list_available_voices()
+    
+    # Every connection is a task on this loop; the semaphore caps how many
+    # requests this process synthesizes at once so a burst can't pile up
+    # unbounded
+    max_requests = int(os.getenv("TTS_MAX_REQUESTS", "64"))
+    slots = asyncio.Semaphore(max_requests)
+    
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(reader, writer, slots),
+        sock=server_socket
+    )
+    async with server:
+        await server.serve_forever()
+
+def run_worker(port, list_voices=False):
+    """Listen on the port and serve clients in this process until interrupted"""
+    setup_logging()
+    
+    # Load environment variables
+    load_environment()
     
     # Create a socket
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     
-    # Enable address reuse
+    # Enable address reuse, and let every worker process bind the same port
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    for option in SOCKET_OPTIONS:
+        server_socket.setsockopt(*option)
     
     # Bind to all interfaces
     server_socket.bind(('0.0.0.0', port))
     
     # Listen for incoming connections
-    server_socket.listen(5)
-    print(f"Server listening on port {port}...")
+    server_socket.listen(socket.SOMAXCONN)
+    log.info("Server listening on port %d...", port)
     
     try:
-        while True:
-            # Accept client connection
-            client_socket, client_address = server_socket.accept()
-            
-            # Handle client in a new thread
-            client_thread = threading.Thread(
-                target=handle_client, 
-                args=(client_socket, client_address)
-            )
-            client_thread.daemon = True
-            client_thread.start()
+        asyncio.run(serve(server_socket, list_voices))
     except KeyboardInterrupt:
-        print("\nServer stopped by user")
+        log.info("Server stopped by user")
     finally:
         server_socket.close()
 
+def start_server(port=12345, list_voices=False, workers=1):
+    """Start the server to listen for incoming text requests"""
+    # Without fork and SO_REUSEPORT (e.g. on Windows) everything runs in one process
+    if workers <= 1 or not hasattr(os, "fork") or not hasattr(socket, "SO_REUSEPORT"):
+        run_worker(port, list_voices)
+        return
+    
+    # Fork the workers before any threads or gRPC channels exist; each binds
+    # its own socket to the port and the kernel spreads connections across them
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(port, list_voices and i == 0)
+            sys.exit(0)
+        pids.append(pid)
+    
+    setup_logging()
+    log.info("Started %d worker processes on port %d", workers, port)
+    live = set(pids)
+    try:
+        # Reap workers in whatever order they exit
+        while live:
+            pid, _ = os.wait()
+            live.discard(pid)
+    except KeyboardInterrupt:
+        # The interrupt reached the workers too, so give them time to flush
+        # their logs and exit (ignoring repeated interrupts meanwhile), and
+        # only then terminate any that are still running
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        deadline = time.monotonic() + STOP_GRACE
+        try:
+            while live and time.monotonic() < deadline:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if pid:
+                    live.discard(pid)
+                else:
+                    time.sleep(0.05)
+        except ChildProcessError:
+            live.clear()  # Every worker has already been reaped
+        for pid in live:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in live:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        log.info("Server stopped by user")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Server for text-to-speech synthesis')
-    parser.add_argument('--port', '-p', type=int, default=12345, 
+    parser.add_argument('--port', '-p', type=int, default=12345,
                         help='Port to listen on (default: 12345)')
     parser.add_argument('--list-voices', '-l', action='store_true',
                         help='List all available voices')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1,
+                        help='Number of server processes (default: number of CPUs)')
     
     args = parser.parse_args()
-    start_server(args.port, args.list_voices)
+    start_server(args.port, args.list_voices, args.workers)